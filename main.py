@@ -1,32 +1,50 @@
 import os
 import argparse
 from pathlib import Path
-from dotenv import load_dotenv
 
-from src.document_processor import DocumentProcessor
-from src.vector_store import VectorStore
-from src.query_processor import QueryProcessor
+from src.document_processor import get_document_processor
+from src.vector_store import get_vector_store
+from src.query_processor import get_query_processor
 from src.config import Config
 
+def positive_int(value: str) -> int:
+    """Parse a strictly positive integer command-line value."""
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
 def process_document(file_path: str):
     """Process a document and add it to the vector store."""
     print(f"Processing document: {file_path}")
     
     # Initialize components
-    doc_processor = DocumentProcessor()
-    vector_store = VectorStore()
-    
-    # Process the PDF
-    print("Extracting text and visual content...")
-    processed_pages = doc_processor.process_pdf(file_path)
-    
-    # Chunk the document
-    print("Chunking document...")
-    chunks = doc_processor.chunk_document(processed_pages)
-    
-    # Add to vector store
-    print(f"Adding {len(chunks)} chunks to vector store...")
-    vector_store.upsert_documents(chunks)
+    doc_processor = get_document_processor()
+    vector_store = get_vector_store()
+    
+    # Stream pages through chunking, embedding and upserting so only the
+    # current batches are held in memory
+    print("Extracting, chunking and embedding document...")
+    chunk_count = 0
+    
+    def count_chunks(chunks):
+        nonlocal chunk_count
+        for chunk in chunks:
+            chunk_count += 1
+            yield chunk
+    
+    pages = doc_processor.iter_pages(file_path)
+    chunks = count_chunks(doc_processor.iter_chunks(pages))
+    try:
+        upserted = vector_store.upsert_documents(chunks)
+    except Exception as e:
+        print(f"Error: Document processing failed: {str(e)}")
+        print("Re-run the command to resume; embeddings computed so far are cached.")
+        raise SystemExit(1)
+    
+    print(f"Added {upserted} chunks to vector store")
+    if upserted < chunk_count:
+        print(f"Warning: Skipped {chunk_count - upserted} chunks that could not be embedded")
     print("Document processing complete!")
 
 def query_system(query: str, use_vision: bool = False):
@@ -34,8 +52,7 @@ def query_system(query: str, use_vision: bool = False):
     print(f"\nProcessing query: {query}")
     
     # Initialize components
-    vector_store = VectorStore()
-    query_processor = QueryProcessor(vector_store)
+    query_processor = get_query_processor()
     
     # Get response
     response = query_processor.generate_response(query, use_vision=use_vision)
@@ -47,7 +64,7 @@ def query_system(query: str, use_vision: bool = False):
 
 def main():
     # Load environment variables
-    load_dotenv()
+    Config.load()
     
     # Create necessary directories
     Config.create_directories()
@@ -59,6 +76,14 @@ def main():
     # Process command
     process_parser = subparsers.add_parser('process', help='Process a document')
     process_parser.add_argument('file_path', type=str, help='Path to the PDF file to process')
+    process_parser.add_argument('--chunk-size', type=positive_int,
+                                help=f'Characters per chunk (default: {Config.CHUNK_SIZE})')
+    process_parser.add_argument('--embed-batch', type=positive_int,
+                                help=f'Chunks per embedding request (default: {Config.EMBED_BATCH_SIZE})')
+    process_parser.add_argument('--batch-size', type=positive_int,
+                                help=f'Vectors per Pinecone upsert (default: {Config.UPSERT_BATCH_SIZE})')
+    process_parser.add_argument('--pool-threads', type=positive_int,
+                                help=f'Parallel Pinecone upsert threads (default: {Config.PINECONE_POOL_THREADS})')
     
     # Query command
     query_parser = subparsers.add_parser('query', help='Query the system')
@@ -74,13 +99,23 @@ def main():
         if not os.path.exists(args.file_path):
             print(f"Error: File not found: {args.file_path}")
             return
+        try:
+            Config.configure(
+                chunk_size=args.chunk_size,
+                batch_size=args.batch_size,
+                embed_batch_size=args.embed_batch,
+                pool_threads=args.pool_threads
+            )
+        except ValueError as e:
+            print(f"Error: {str(e)}")
+            return
         process_document(args.file_path)
     
     elif args.command == 'query':
         query_system(args.query, use_vision=args.vision)
     
     elif args.command == 'clear':
-        vector_store = VectorStore()
+        vector_store = get_vector_store()
         vector_store.delete_all_vectors()
     
     else:
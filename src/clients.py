@@ -0,0 +1,53 @@
+import threading
+from typing import Dict, Optional
+import google.generativeai as genai
+
+from .config import Config
+
+# Gemini clients shared by every component, created once per process
+_lock = threading.Lock()
+_configured = False
+_gemini_models: Dict[Optional[str], genai.GenerativeModel] = {}
+_gemini_embedding_model: Optional[genai.GenerativeModel] = None
+
+def _configure_gemini() -> None:
+    """Configure the Gemini SDK once. Must be called with the lock held."""
+    global _configured
+    if _configured:
+        return
+    
+    if not Config.GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY not found in environment variables")
+    
+    genai.configure(api_key=Config.GEMINI_API_KEY)
+    _configured = True
+
+def configure_gemini() -> None:
+    """Configure the Gemini SDK for module-level calls such as genai.embed_content."""
+    with _lock:
+        _configure_gemini()
+
+def get_gemini_model(system_instruction: Optional[str] = None) -> genai.GenerativeModel:
+    """Return the shared Gemini model used for text and vision, one per system instruction."""
+    with _lock:
+        if system_instruction not in _gemini_models:
+            _configure_gemini()
+            try:
+                _gemini_models[system_instruction] = genai.GenerativeModel(
+                    Config.GEMINI_MODEL,
+                    system_instruction=system_instruction
+                )
+                print(f"Initialized Gemini model: {Config.GEMINI_MODEL}")
+            except Exception as e:
+                print(f"Error initializing Gemini model: {str(e)}")
+                raise
+        return _gemini_models[system_instruction]
+
+def get_gemini_embedding_model() -> genai.GenerativeModel:
+    """Return the shared Gemini embedding model."""
+    global _gemini_embedding_model
+    with _lock:
+        if _gemini_embedding_model is None:
+            _configure_gemini()
+            _gemini_embedding_model = genai.GenerativeModel(Config.GEMINI_EMBEDDING_MODEL)
+        return _gemini_embedding_model
@@ -1,42 +1,87 @@
 import os
 from dotenv import load_dotenv
 from pathlib import Path
-
-# Load environment variables from .env file
-env_path = Path(__file__).parent.parent / '.env'
-load_dotenv(env_path)
+from typing import Optional
 
 class Config:
     # OpenAI
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_API_KEY = None  # Resolved by Config.load()
     EMBEDDING_MODEL = "text-embedding-3-large"
     EMBEDDING_DIM = 3072  # Dimension for text-embedding-3-large
     VISION_MODEL = "gpt-4o"
     
     # Google Gemini 1.5 Flash (single model for both text and vision)
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    GEMINI_API_KEY = None  # Resolved by Config.load()
     GEMINI_MODEL = "gemini-1.5-flash"  # Single model for both text and vision
+    GEMINI_MAX_CONCURRENCY = 8  # Concurrent image description requests across all PDF workers
     
     # Embedding configuration
     GEMINI_EMBEDDING_MODEL = "models/embedding-001"  # Default embedding model
     GEMINI_EMBEDDING_DIM = 768  # Dimension for Gemini embedding-001 model
     
+    # Caching
+    EMBEDDING_CACHE_SIZE = 1024  # Exact-match embeddings kept in memory
+    SEMANTIC_CACHE_THRESHOLD = 0.95  # Minimum cosine similarity to reuse a cached answer
+    SEMANTIC_CACHE_SIZE = 256
+    SEMANTIC_CACHE_TTL = 300  # Seconds
+    LOCAL_INDEX_SIZE = 10000  # Recently upserted vectors searchable without Pinecone
+    LOCAL_INDEX_THRESHOLD = 0.75  # Minimum cosine similarity to answer a search locally
+    LOCAL_INDEX_MIN_SIZE = 1000  # Vectors held locally before searches may skip Pinecone
+    
     # Pinecone index settings - must match the embedding dimension
     PINECONE_INDEX_DIMENSION = GEMINI_EMBEDDING_DIM  # This ensures consistency
     
     # Pinecone
-    PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-    PINECONE_ENV = os.getenv("PINECONE_ENV", "gcp-starter")
+    PINECONE_API_KEY = None  # Resolved by Config.load()
+    PINECONE_ENV = "gcp-starter"
     INDEX_NAME = "multimodal-rag-index"
+    PINECONE_POOL_THREADS = min(30, 4 * (os.cpu_count() or 1))  # Threads used for parallel (async_req) upserts
+    UPSERT_BATCH_SIZE = 64  # Vectors per Pinecone upsert request
+    EMBED_BATCH_SIZE = 100  # Texts per Gemini embedding request
     
     # File paths
     DATA_DIR = "data"
     DOCUMENTS_DIR = os.path.join(DATA_DIR, "documents")
     IMAGES_DIR = os.path.join(DATA_DIR, "images")
+    # Anchored to the project root: Pinecone metadata only references chunk
+    # contents by hash, so every command must open the same store
+    CONTENT_STORE_PATH = str(Path(__file__).parent.parent / DATA_DIR / "content_store.sqlite3")
     
     # Processing
     CHUNK_SIZE = 1000
     CHUNK_OVERLAP = 200
+    PDF_WORKERS = min(os.cpu_count() or 1, 4)  # Worker processes for PDF page processing
+    
+    ENV_PATH = Path(__file__).parent.parent / '.env'
+    _loaded = False
+    
+    @classmethod
+    def load(cls):
+        """Load environment variables from the .env file and resolve API settings."""
+        if cls._loaded:
+            return
+        
+        load_dotenv(cls.ENV_PATH)
+        cls.OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+        cls.GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+        cls.PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+        cls.PINECONE_ENV = os.getenv("PINECONE_ENV", cls.PINECONE_ENV)
+        cls._loaded = True
+    
+    @classmethod
+    def configure(cls, chunk_size: Optional[int] = None, batch_size: Optional[int] = None,
+                  embed_batch_size: Optional[int] = None, pool_threads: Optional[int] = None):
+        """Override the tuned processing defaults, e.g. from command-line flags."""
+        if chunk_size is not None:
+            if chunk_size <= cls.CHUNK_OVERLAP:
+                raise ValueError(f"Chunk size must be larger than the chunk overlap ({cls.CHUNK_OVERLAP})")
+            cls.CHUNK_SIZE = chunk_size
+        if batch_size is not None:
+            cls.UPSERT_BATCH_SIZE = batch_size
+        if embed_batch_size is not None:
+            cls.EMBED_BATCH_SIZE = embed_batch_size
+        if pool_threads is not None:
+            cls.PINECONE_POOL_THREADS = pool_threads
     
     @classmethod
     def create_directories(cls):
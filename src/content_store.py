@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+
+
+class ContentStore:
+    """Local SQLite tables of chunk contents and embeddings keyed by content hash."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # The store is shared across threads with its VectorStore, so one
+        # connection is used from any thread and serialized by a lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (hash TEXT PRIMARY KEY, content TEXT NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "hash TEXT NOT NULL, model TEXT NOT NULL, embedding BLOB NOT NULL, "
+            "PRIMARY KEY (hash, model))"
+        )
+        self.connection.commit()
+
+    def put_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        """Store (hash, content) pairs, ignoring hashes that are already present."""
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO chunks (hash, content) VALUES (?, ?)", items
+            )
+            self.connection.commit()
+
+    def get_many(self, hashes: List[str]) -> Dict[str, str]:
+        """Fetch the contents for several hashes in one query."""
+        with self._lock:
+            if not hashes:
+                return {}
+            placeholders = ",".join("?" * len(hashes))
+            rows = self.connection.execute(
+                f"SELECT hash, content FROM chunks WHERE hash IN ({placeholders})", hashes
+            )
+            return dict(rows.fetchall())
+
+    def get_embeddings(self, hashes: List[str], model: str) -> Dict[str, List[float]]:
+        """Fetch cached embeddings produced by the given model for several hashes."""
+        with self._lock:
+            hashes = list(set(hashes))
+            if not hashes:
+                return {}
+            placeholders = ",".join("?" * len(hashes))
+            rows = self.connection.execute(
+                f"SELECT hash, embedding FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                [model] + hashes
+            )
+            return {
+                chunk_hash: np.frombuffer(blob, dtype=np.float32).tolist()
+                for chunk_hash, blob in rows.fetchall()
+            }
+
+    def put_embeddings(self, embeddings: Dict[str, List[float]], model: str) -> None:
+        """Cache embeddings produced by the given model, keyed by content hash."""
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (hash, model, embedding) VALUES (?, ?, ?)",
+                [
+                    (chunk_hash, model, np.asarray(embedding, dtype=np.float32).tobytes())
+                    for chunk_hash, embedding in embeddings.items()
+                ]
+            )
+            self.connection.commit()
+
+    def clear(self) -> None:
+        """Delete all stored contents."""
+        with self._lock:
+            self.connection.execute("DELETE FROM chunks")
+            self.connection.commit()
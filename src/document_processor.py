@@ -1,16 +1,20 @@
-import os
 import io
 import base64
+import asyncio
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 import fitz  # PyMuPDF
 from PIL import Image
 from tqdm import tqdm
 import pandas as pd
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 import openai
 from openai import OpenAI
-import google.generativeai as genai
 from pathlib import Path
 
+from .clients import get_gemini_model
 from .config import Config
 
 class DocumentProcessor:
@@ -18,51 +22,121 @@ class DocumentProcessor:
         self.config = Config
         self.openai_client = OpenAI(api_key=Config.OPENAI_API_KEY)
         
-        # Initialize Gemini 1.5 Flash
-        if not Config.GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
-            
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        try:
-            self.gemini_model = genai.GenerativeModel(Config.GEMINI_MODEL)
-            print(f"Initialized Gemini model: {Config.GEMINI_MODEL}")
-        except Exception as e:
-            print(f"Error initializing Gemini model: {str(e)}")
-            raise
+        # Shared Gemini 1.5 Flash client
+        self.gemini_model = get_gemini_model()
         
         Config.create_directories()
+        
+        # Reusable encode buffer for images that need resizing or conversion
+        self._jpeg_buf = io.BytesIO()
+        
+        # The model caches its async gRPC client, which is bound to the event loop
+        # it was first used on, so every page must run on the same loop
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
 
     def process_pdf(self, pdf_path: str) -> List[Dict[str, Any]]:
         """Process a PDF file and extract text and visual information."""
-        pages = self._extract_pages(pdf_path)
-        processed_pages = []
+        return list(self.iter_pages(pdf_path))
+
+    def iter_pages(self, pdf_path: str) -> Iterator[Dict[str, Any]]:
+        """Yield processed pages in order as they become available."""
+        with fitz.open(pdf_path) as doc:
+            n_pages = doc.page_count
         
-        for page_num, page in enumerate(tqdm(pages, desc="Processing PDF pages")):
-            # Extract text
-            text = page.get_text()
-            
-            # Extract images and get descriptions
-            image_descriptions = self._extract_and_describe_images(page, page_num)
-            
-            # Combine text and image descriptions
-            page_content = {
-                'page_number': page_num + 1,
-                'text': text,
-                'image_descriptions': image_descriptions,
-                'full_content': f"Page {page_num + 1}\n\n{text}"
-            }
-            
-            if image_descriptions:
-                page_content['full_content'] += "\n\nVisual Content:\n" + "\n".join(image_descriptions)
-            
-            processed_pages.append(page_content)
+        # Pages are independent, so process them in parallel worker processes.
+        # Only a small window of pages is submitted ahead of the consumer, so
+        # finished pages cannot pile up when embedding and upserting lag behind.
+        # Short documents don't need a worker (and a Gemini client) per CPU
+        workers = max(1, min(self.config.PDF_WORKERS, n_pages))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        page_nums = iter(range(n_pages))
+        pending = deque(
+            executor.submit(_process_page_worker, pdf_path, page_num)
+            for page_num in islice(page_nums, workers * 2)
+        )
         
-        return processed_pages
+        try:
+            with tqdm(total=n_pages, desc="Processing PDF pages") as progress:
+                while pending:
+                    page = pending.popleft().result()
+                    for page_num in islice(page_nums, 1):
+                        pending.append(executor.submit(_process_page_worker, pdf_path, page_num))
+                    progress.update(1)
+                    yield page
+        except BaseException:
+            # Don't pay for the remaining pages (and their Gemini calls) when the
+            # consumer fails or stops early
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+            raise
+        
+        executor.shutdown()
+
+    def _process_page(self, page: Any, page_num: int) -> Dict[str, Any]:
+        """Extract text and image descriptions from a single page."""
+        # Extract text in reading order
+        text = self._extract_text(page)
+        
+        # Extract images and get descriptions
+        image_descriptions = self._extract_and_describe_images(page, page_num)
+        
+        # Combine text and image descriptions
+        page_content = {
+            'page_number': page_num + 1,
+            'text': text,
+            'image_descriptions': image_descriptions,
+            'full_content': f"Page {page_num + 1}\n\n{text}"
+        }
+        
+        if image_descriptions:
+            page_content['full_content'] += "\n\nVisual Content:\n" + "\n".join(image_descriptions)
+        
+        return page_content
 
-    def _extract_pages(self, pdf_path: str) -> List[Any]:
-        """Extract pages from a PDF file."""
-        doc = fitz.open(pdf_path)
-        return [doc.load_page(i) for i in range(len(doc))]
+    def _extract_text(self, page: Any) -> str:
+        """Extract page text from layout blocks, reading two-column layouts column by column."""
+        # Each block is (x0, y0, x1, y1, text, block_no, block_type); type 1 is an image
+        blocks = [block for block in page.get_text("blocks") if block[6] == 0 and block[4].strip()]
+        middle = page.rect.width / 2
+        
+        # Blocks spanning the middle (titles, single-column text) split the page
+        # into bands that are ordered independently
+        ordered = []
+        band = []
+        for block in sorted(blocks, key=lambda block: (block[1], block[0])):
+            if block[0] < middle < block[2]:
+                ordered.extend(self._order_band(band, middle))
+                band = []
+                ordered.append(block)
+            else:
+                band.append(block)
+        ordered.extend(self._order_band(band, middle))
+        
+        return "\n\n".join(block[4].strip() for block in ordered)
+
+    def _order_band(self, band: List[Any], middle: float, row_tolerance: float = 3.0) -> List[Any]:
+        """Order the blocks of a band as two text columns, or as table rows when they line up."""
+        left = [block for block in band if block[0] < middle]
+        right = [block for block in band if block[0] >= middle]
+        
+        # Cells of a table row share their top and bottom edges; paragraphs of
+        # running text columns may start level but rarely end level too
+        aligned = sum(
+            1 for r in right
+            if any(abs(r[1] - l[1]) <= row_tolerance and abs(r[3] - l[3]) <= row_tolerance for l in left)
+        )
+        if left and right and aligned < len(right) / 2:
+            return sorted(left, key=lambda block: block[1]) + sorted(right, key=lambda block: block[1])
+        
+        # Read row by row, left to right, so labels stay next to their values
+        rows = []
+        for block in sorted(band, key=lambda block: block[1]):
+            if rows and block[1] - rows[-1][0][1] <= row_tolerance:
+                rows[-1].append(block)
+            else:
+                rows.append([block])
+        return [block for row in rows for block in sorted(row, key=lambda block: block[0])]
 
     def _extract_and_describe_images(self, page: Any, page_num: int) -> List[str]:
         """Extract images from a page and get descriptions using GPT-4 Vision."""
@@ -70,57 +144,80 @@ class DocumentProcessor:
         if not image_list:
             return []
             
-        descriptions = []
+        images = []
         for img_index, img in enumerate(image_list):
             try:
                 # Extract image
                 xref = img[0]
                 base_image = page.parent.extract_image(xref)
-                image_bytes = base_image["image"]
-                
-                # Save image temporarily
-                image_path = os.path.join(
-                    self.config.IMAGES_DIR,
-                    f"page_{page_num + 1}_img_{img_index + 1}.png"
-                )
-                with open(image_path, "wb") as img_file:
-                    img_file.write(image_bytes)
-                
-                # Get description from GPT-4 Vision
-                description = self._get_image_description(image_path)
-                descriptions.append(description)
-                
-                # Clean up
-                os.remove(image_path)
+                images.append((img_index, base_image["image"], base_image["ext"]))
                 
             except Exception as e:
                 print(f"Error processing image {img_index} on page {page_num + 1}: {str(e)}")
                 continue
+        
+        if not images:
+            return []
+        
+        # Describe all images on the page concurrently
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        results = self._loop.run_until_complete(
+            self._describe_images_async([(image_bytes, ext) for _, image_bytes, ext in images])
+        )
+        
+        descriptions = []
+        for (img_index, _, _), result in zip(images, results):
+            if isinstance(result, Exception):
+                print(f"Error processing image {img_index} on page {page_num + 1}: {str(result)}")
+                continue
+            descriptions.append(result)
                 
         return descriptions
 
-    def _get_image_description(self, image_path: str) -> str:
+    async def _describe_images_async(self, images: List[Tuple[bytes, str]]) -> List[Any]:
+        """Describe several images concurrently, bounded by the Gemini concurrency limit."""
+        # Every PDF worker process runs its own pages, so each gets a share of the budget
+        semaphore = asyncio.Semaphore(max(1, self.config.GEMINI_MAX_CONCURRENCY // self.config.PDF_WORKERS))
+        
+        async def describe(image_bytes: bytes, ext: str) -> str:
+            async with semaphore:
+                return await self._describe_image_async(image_bytes, ext)
+        
+        return await asyncio.gather(*(describe(image_bytes, ext) for image_bytes, ext in images), return_exceptions=True)
+
+    async def _describe_image_async(self, image_bytes: bytes, ext: str) -> str:
         """Get description of an image using Gemini 1.5 Flash."""
         if not hasattr(self, 'gemini_model') or not self.gemini_model:
             return "[Image processing not available]"
             
         try:
-            # Read and resize image to reduce processing requirements
-            img = Image.open(image_path)
-            
-            # Convert to RGB if needed
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Resize if image is too large
+            # Opening is lazy: only the header is read until pixels are needed
+            img = Image.open(io.BytesIO(image_bytes))
             max_size = (2048, 2048)  # Higher resolution for better OCR
-            if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
             
-            # Convert to bytes
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='JPEG', quality=90)
-            img_byte_arr = img_byte_arr.getvalue()
+            if (ext in ('jpeg', 'jpg', 'png') and img.mode != 'CMYK'
+                    and img.size[0] <= max_size[0] and img.size[1] <= max_size[1]):
+                # Gemini accepts the original encoding, so skip the decode/re-encode
+                img_byte_arr = image_bytes
+                mime_type = "image/png" if ext == 'png' else "image/jpeg"
+            else:
+                # Convert to RGB if needed
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                
+                # Resize if image is too large
+                if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
+                    img.thumbnail(max_size, Image.Resampling.LANCZOS)
+                
+                # Convert to bytes, reusing one buffer across images. There is no
+                # await between writing and reading it, so concurrent
+                # descriptions cannot interleave here.
+                self._jpeg_buf.seek(0)
+                self._jpeg_buf.truncate(0)
+                img.save(self._jpeg_buf, format='JPEG', quality=90)
+                img_byte_arr = self._jpeg_buf.getvalue()
+                mime_type = "image/jpeg"
             
             # Prepare the prompt
             prompt = """
@@ -138,14 +235,14 @@ class DocumentProcessor:
                 {"text": prompt},
                 {
                     "inline_data": {
-                        "mime_type": "image/jpeg",
+                        "mime_type": mime_type,
                         "data": base64.b64encode(img_byte_arr).decode('utf-8')
                     }
                 }
             ]
             
             # Generate the response
-            response = self.gemini_model.generate_content(
+            response = await self.gemini_model.generate_content_async(
                 contents=message,
                 generation_config={
                     'max_output_tokens': 2048,
@@ -159,25 +256,60 @@ class DocumentProcessor:
             return response.text.strip()
             
         except Exception as e:
-            print(f"Error processing image {image_path}: {str(e)}")
+            print(f"Error processing image: {str(e)}")
             return f"[Image description error: {str(e)}]"
 
     def chunk_document(self, processed_pages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Split document into smaller chunks for processing."""
-        chunks = []
+        return list(self.iter_chunks(processed_pages))
+
+    def iter_chunks(self, processed_pages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Yield chunks of the document as pages arrive."""
         chunk_id = 0
+        chunk_size = self.config.CHUNK_SIZE
+        overlap = self.config.CHUNK_OVERLAP
+        step = chunk_size - overlap
         
         for page in processed_pages:
             text = page['full_content']
-            # Simple chunking by characters, can be improved with better text splitting
-            for i in range(0, len(text), self.config.CHUNK_SIZE - self.config.CHUNK_OVERLAP):
-                chunk = text[i:i + self.config.CHUNK_SIZE]
-                chunks.append({
+            has_images = len(page.get('image_descriptions', [])) > 0
+            
+            # Simple chunking by characters. Windows starting inside the final
+            # overlap would only repeat the tail of the previous chunk, so stop
+            # before them instead of paying for an extra embedding.
+            for i in range(0, max(len(text) - overlap, 1), step):
+                yield {
                     'chunk_id': chunk_id,
                     'page_number': page['page_number'],
-                    'content': chunk,
-                    'has_images': len(page.get('image_descriptions', [])) > 0
-                })
+                    'chunk_offset': i,
+                    'content': text[i:i + chunk_size],
+                    'has_images': has_images
+                }
                 chunk_id += 1
-                
-        return chunks
+
+
+@functools.lru_cache(maxsize=1)
+def get_document_processor() -> DocumentProcessor:
+    """Return the shared DocumentProcessor, creating it on first use."""
+    return DocumentProcessor()
+
+# PDF kept open by the current worker process, as (path, document)
+_worker_document: Optional[Tuple[str, Any]] = None
+
+def _get_worker_document(pdf_path: str) -> Any:
+    """Return the worker's open document for pdf_path, parsing it only once."""
+    global _worker_document
+    if _worker_document is None or _worker_document[0] != pdf_path:
+        if _worker_document is not None:
+            _worker_document[1].close()
+        _worker_document = (pdf_path, fitz.open(pdf_path))
+    return _worker_document[1]
+
+def _process_page_worker(pdf_path: str, page_num: int) -> Dict[str, Any]:
+    """Process a single PDF page inside a worker process."""
+    # Worker processes may not have inherited the parent's configuration
+    Config.load()
+    processor = get_document_processor()
+    
+    page = _get_worker_document(pdf_path).load_page(page_num)
+    return processor._process_page(page, page_num)
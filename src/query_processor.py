@@ -1,26 +1,30 @@
+import functools
 from typing import List, Dict, Any
 from openai import OpenAI
-import google.generativeai as genai
 from tqdm import tqdm
 
+from .clients import get_gemini_model
 from .config import Config
+from .vector_store import get_vector_store
+
+SYSTEM_PROMPT = """You are a helpful assistant that answers questions based on the provided context. 
+                If the context doesn't contain the answer, say you don't know. 
+                Be concise and accurate in your responses."""
+
+VISION_INSTRUCTIONS = " When describing visual content, be sure to include details from the image descriptions provided in the context."
 
 class QueryProcessor:
     def __init__(self, vector_store):
         self.vector_store = vector_store
         self.openai_client = OpenAI(api_key=Config.OPENAI_API_KEY)
         
-        # Initialize Gemini 1.5 Flash
-        if not Config.GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
-            
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        try:
-            self.gemini_model = genai.GenerativeModel(Config.GEMINI_MODEL)
-            print(f"Initialized Gemini model for query processing: {Config.GEMINI_MODEL}")
-        except Exception as e:
-            print(f"Error initializing Gemini model: {str(e)}")
-            raise
+        # Shared Gemini 1.5 Flash clients, one per system prompt variant
+        self.gemini_models = {
+            vision_prompt: get_gemini_model(
+                system_instruction=SYSTEM_PROMPT + (VISION_INSTRUCTIONS if vision_prompt else "")
+            )
+            for vision_prompt in (False, True)
+        }
         
         self.config = Config
 
@@ -35,6 +39,22 @@ class QueryProcessor:
         Returns:
             Dict containing the response and metadata
         """
+        # 0. Reuse the answer to a semantically similar earlier query
+        try:
+            query_embedding = self.vector_store.get_embedding(query)
+        except Exception as e:
+            print(f"Error generating query embedding: {str(e)}")
+            return {
+                'answer': "I'm sorry, I couldn't process your question right now. Please try again.",
+                'sources': [],
+                'context': []
+            }
+        
+        response_cache = self.vector_store.response_caches[use_vision]
+        cached_response = response_cache.get(query_embedding)
+        if cached_response is not None:
+            return cached_response
+        
         # 1. Retrieve relevant documents
         search_results = self.vector_store.search(query, top_k=3)
         
@@ -60,67 +80,28 @@ class QueryProcessor:
         
         context = "\n\n".join(context_parts)
         
-        # 3. Generate response using GPT-4
-        messages = [
-            {
-                "role": "system",
-                "content": """You are a helpful assistant that answers questions based on the provided context. 
-                If the context doesn't contain the answer, say you don't know. 
-                Be concise and accurate in your responses."""
-            },
-            {
-                "role": "user",
-                "content": f"""Context:
+        # 3. Build the user turn; the system prompt is set on the model
+        user_content = f"""Context:
                 {context}
                 
                 Question: {query}
                 
                 Answer the question based on the context above. If the context doesn't contain the answer, say you don't know."""
-            }
-        ]
         
-        # 4. If visual context is needed, enhance the prompt
-        if use_vision and any(src['has_images'] for src in sources):
-            messages[0]['content'] += " When describing visual content, be sure to include details from the image descriptions provided in the context."
+        # 4. If visual context is needed, use the vision-enhanced system prompt
+        vision_prompt = use_vision and any(src['has_images'] for src in sources)
         
         # 5. Get response from the model using Gemini 1.5 Flash
-        if not hasattr(self, 'gemini_model') or not self.gemini_model:
+        if not getattr(self, 'gemini_models', None):
             return {
                 'answer': "Error: Gemini model is not available. Please check your API key and model configuration.",
                 'sources': sources
             }
             
+        cacheable = False
         try:
-            # Format messages for Gemini 1.5 Flash
-            # Gemini 1.5 Flash supports both system and user messages in a conversation
-            formatted_messages = []
-            
-            # Add system message if present
-            system_message = next((msg for msg in messages if msg['role'] == 'system'), None)
-            if system_message:
-                formatted_messages.append({
-                    'role': 'user',
-                    'parts': [{'text': system_message['content']}]
-                })
-                formatted_messages.append({
-                    'role': 'model',
-                    'parts': [{'text': 'I understand and will assist with your request.'}]
-                })
-            
-            # Add user message
-            user_message = next((msg for msg in messages if msg['role'] == 'user'), None)
-            if user_message:
-                formatted_messages.append({
-                    'role': 'user',
-                    'parts': [{'text': user_message['content']}]
-                })
-            
-            # Generate response with Gemini 1.5 Flash
-            response = self.gemini_model.generate_content(
-                contents={
-                    'role': 'user',
-                    'parts': [{'text': user_message['content']}]
-                },
+            response = self.gemini_models[vision_prompt].generate_content(
+                user_content,
                 generation_config={
                     'temperature': 0.3,
                     'max_output_tokens': 2048,  # Increased for more detailed responses
@@ -133,6 +114,7 @@ class QueryProcessor:
                 raise ValueError("Empty response from Gemini model")
                 
             answer = response.text.strip()
+            cacheable = True
             
         except Exception as e:
             error_msg = str(e).lower()
@@ -145,11 +127,17 @@ class QueryProcessor:
             else:
                 answer = "I'm sorry, I encountered an error while generating a response. The error was: " + str(e)
         
-        return {
+        result = {
             'answer': answer,
             'sources': sources,
             'context': context_parts
         }
+        
+        # Only successful answers are worth serving again
+        if cacheable:
+            response_cache.put(query_embedding, result)
+        
+        return result
     
     def format_response(self, response: Dict[str, Any]) -> str:
         """Format the response for display."""
@@ -164,3 +152,9 @@ class QueryProcessor:
                     formatted += "(Contains visual content)\n"
         
         return formatted
+
+
+@functools.lru_cache(maxsize=1)
+def get_query_processor() -> QueryProcessor:
+    """Return the shared QueryProcessor over the shared VectorStore."""
+    return QueryProcessor(get_vector_store())
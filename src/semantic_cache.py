@@ -0,0 +1,55 @@
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional
+import numpy as np
+
+
+class SemanticCache:
+    """In-memory LRU cache of values keyed by L2-normalized embeddings with a TTL."""
+
+    def __init__(self, threshold: float, maxsize: int = 256, ttl: float = 300.0):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Maps entry id -> (normalized embedding, value, insertion time)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._next_id = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        expired = [key for key, (_, _, created) in self._entries.items() if now - created > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, embedding: List[float]) -> Optional[Any]:
+        """Return the cached value for the most similar embedding, if close enough."""
+        self._evict_expired()
+        if not self._entries:
+            return None
+        
+        keys = list(self._entries.keys())
+        matrix = np.stack([self._entries[key][0] for key in keys])
+        scores = matrix @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        
+        self._entries.move_to_end(keys[best])
+        return self._entries[keys[best]][1]
+
+    def clear(self) -> None:
+        """Drop all cached entries."""
+        self._entries.clear()
+
+    def put(self, embedding: List[float], value: Any) -> None:
+        """Store a value under the given embedding."""
+        self._entries[self._next_id] = (self._normalize(embedding), value, time.monotonic())
+        self._next_id += 1
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
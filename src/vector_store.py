@@ -1,30 +1,87 @@
 import os
 import time
-from typing import List, Dict, Any, Optional, Union
+import hashlib
+import functools
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Union
 import numpy as np
 from openai import OpenAI
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import pinecone
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 from tqdm import tqdm
 
+from .clients import configure_gemini, get_gemini_embedding_model
 from .config import Config
+from .content_store import ContentStore
+from .semantic_cache import SemanticCache
+
+# Errors worth retrying: the request itself is fine, the service is not
+TRANSIENT_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    TimeoutError
+)
+
+@retry(
+    wait=wait_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception_type(TRANSIENT_ERRORS),
+    reraise=True
+)
+def _embed_content(**kwargs) -> Dict[str, Any]:
+    """Call the Gemini embedding API, retrying transient failures with backoff."""
+    return genai.embed_content(**kwargs)
+
+def chunks(iterable: Iterable, batch_size: int) -> Iterator[List]:
+    """Break an iterable into lists of at most batch_size items."""
+    it = iter(iterable)
+    chunk = list(islice(it, batch_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(it, batch_size))
+
+def content_hash(content: str) -> str:
+    """Short SHA-1 digest identifying a chunk's content."""
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
 
 class VectorStore:
     def __init__(self):
         self.config = Config
         self.openai_client = OpenAI(api_key=Config.OPENAI_API_KEY)
         
-        # Initialize Gemini
-        if not Config.GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
-            
-        genai.configure(api_key=Config.GEMINI_API_KEY)
+        # Shared Gemini client; embeddings go through the configured genai module
+        configure_gemini()
         try:
-            self.gemini_embedding_model = genai.GenerativeModel(Config.GEMINI_EMBEDDING_MODEL)
+            self.gemini_embedding_model = get_gemini_embedding_model()
         except Exception as e:
             print(f"Warning: Could not initialize Gemini embedding model: {str(e)}")
             self.gemini_embedding_model = None
         
+        # Exact-match embedding cache keyed by the SHA-1 of the text
+        self._embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        
+        # Local index of recently upserted chunks (L2-normalized rows) that can
+        # answer searches without a Pinecone round trip
+        self._clear_local_index()
+        
+        # Generated answers for semantically similar queries, per use_vision mode.
+        # Owned by the store so they can be dropped whenever its contents change.
+        self.response_caches = {
+            use_vision: SemanticCache(
+                threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+                maxsize=Config.SEMANTIC_CACHE_SIZE,
+                ttl=Config.SEMANTIC_CACHE_TTL
+            )
+            for use_vision in (False, True)
+        }
+        
+        # Full chunk contents live locally; Pinecone metadata only references them by hash
+        self.content_store = ContentStore(Config.CONTENT_STORE_PATH)
+        
         # Initialize Pinecone
         self.pinecone_client = self._init_pinecone()
         self.index = self._get_or_create_index()
@@ -70,8 +127,8 @@ class VectorStore:
                     time.sleep(1)
                 print("Index is ready!")
             
-            # Connect to the index
-            return self.pinecone_client.Index(index_name)
+            # Connect to the index with a thread pool for parallel upserts
+            return self.pinecone_client.Index(index_name, pool_threads=self.config.PINECONE_POOL_THREADS)
             
         except Exception as e:
             print(f"Error managing Pinecone index: {str(e)}")
@@ -79,65 +136,261 @@ class VectorStore:
 
     def get_embedding(self, text: str) -> List[float]:
         """Get embedding for a text using Google's Gemini embedding model."""
+        # Truncate text if it's too long (Gemini has token limits)
+        if len(text) > 10000:  # Approximate character limit
+            text = text[:10000]
+        
+        # Return the cached embedding for previously seen text
+        cache_key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        if cache_key in self._embedding_cache:
+            self._embedding_cache.move_to_end(cache_key)
+            return self._embedding_cache[cache_key]
+        
+        # Generate embedding using the genai client directly
+        result = _embed_content(
+            model=self.config.GEMINI_EMBEDDING_MODEL,
+            content=text,
+            task_type="retrieval_document"
+        )
+        
+        # Extract the embedding values
+        if 'embedding' not in result:
+            raise ValueError("No embedding found in the response")
+        
+        self._embedding_cache[cache_key] = result['embedding']
+        if len(self._embedding_cache) > self.config.EMBEDDING_CACHE_SIZE:
+            self._embedding_cache.popitem(last=False)
+        return result['embedding']
+
+    def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Get embeddings for a list of texts in a single Gemini API call."""
+        if not texts:
+            return []
+        
+        # Truncate texts that are too long (Gemini has token limits)
+        texts = [text[:10000] if len(text) > 10000 else text for text in texts]
+        
+        # A list of contents yields one embedding per input
+        result = _embed_content(
+            model=self.config.GEMINI_EMBEDDING_MODEL,
+            content=texts,
+            task_type="retrieval_document"
+        )
+        
+        embeddings = result.get('embedding')
+        if not embeddings or len(embeddings) != len(texts):
+            raise ValueError("Embedding count does not match the number of inputs")
+        return embeddings
+
+    def _embed_documents(self, documents: List[Dict[str, Any]],
+                         first_chunk_ids: Dict[str, Any]) -> List[Tuple[Dict[str, Any], List[float]]]:
+        """Embed a batch of documents, reusing embeddings of previously seen content."""
+        model = self.config.GEMINI_EMBEDDING_MODEL
+        hashes = [content_hash(doc['content']) for doc in documents]
+        embeddings = self.content_store.get_embeddings(hashes, model)
+        
+        # Only embed each distinct unseen content once
+        missing = {}
+        for doc, chunk_hash in zip(documents, hashes):
+            if chunk_hash not in embeddings:
+                missing.setdefault(chunk_hash, doc)
+        
+        if missing:
+            computed = self._compute_embeddings(missing)
+            self.content_store.put_embeddings(computed, model)
+            embeddings.update(computed)
+        
+        embedded = []
+        for doc, chunk_hash in zip(documents, hashes):
+            if chunk_hash not in embeddings:
+                continue
+            # Point repeated chunks at the first chunk with the same content
+            first_chunk_id = first_chunk_ids.setdefault(chunk_hash, doc['chunk_id'])
+            if first_chunk_id != doc['chunk_id']:
+                doc = {**doc, 'duplicate_of': first_chunk_id}
+            embedded.append((doc, embeddings[chunk_hash]))
+        return embedded
+
+    def _compute_embeddings(self, documents: Dict[str, Dict[str, Any]]) -> Dict[str, List[float]]:
+        """Embed documents keyed by content hash, skipping chunks whose input is rejected.
+
+        Transient errors (quota, availability, timeouts) that outlast the retries are
+        raised so the ingest fails and can be re-run instead of silently losing chunks.
+        """
         try:
-            # Truncate text if it's too long (Gemini has token limits)
-            if len(text) > 10000:  # Approximate character limit
-                text = text[:10000]
-            
-            # Generate embedding using the genai client directly
-            result = genai.embed_content(
-                model=self.config.GEMINI_EMBEDDING_MODEL,
-                content=text,
-                task_type="retrieval_document"
-            )
-            
-            # Extract the embedding values
-            if 'embedding' in result:
-                return result['embedding']
-            else:
-                raise ValueError("No embedding found in the response")
-                
+            embeddings = self.get_embeddings_batch([doc['content'] for doc in documents.values()])
+            return dict(zip(documents.keys(), embeddings))
+        except TRANSIENT_ERRORS:
+            raise
         except Exception as e:
-            print(f"Error generating Gemini embedding: {str(e)}")
-            # Fallback to random embeddings in case of error
-            import random
-            return [random.random() for _ in range(self.config.GEMINI_EMBEDDING_DIM)]
-
-    def upsert_documents(self, documents: List[Dict[str, Any]], batch_size: int = 100) -> None:
-        """Upsert documents to the vector store."""
-        vectors = []
-        
-        for doc in tqdm(documents, desc="Processing documents"):
-            # Generate embedding for the document content
-            embedding = self.get_embedding(doc['content'])
-            
-            # Create a vector with metadata
-            vector = {
-                'id': str(doc['chunk_id']),
-                'values': embedding,
-                'metadata': {
+            # Most likely one bad input; isolate it by embedding chunks individually
+            print(f"Error generating batched Gemini embeddings, retrying chunks individually: {str(e)}")
+        
+        embeddings = {}
+        for chunk_hash, doc in documents.items():
+            try:
+                embeddings[chunk_hash] = self.get_embedding(doc['content'])
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as e:
+                print(f"Warning: Skipping chunk {doc['chunk_id']} after embedding failure: {str(e)}")
+        return embeddings
+
+    def iter_embeddings(self, documents: Iterable[Dict[str, Any]],
+                        batch_size: Optional[int] = None) -> Iterator[Tuple[Dict[str, Any], List[float]]]:
+        """Yield (document, embedding) pairs, embedding documents batch_size at a time."""
+        batch_size = batch_size or self.config.EMBED_BATCH_SIZE
+        first_chunk_ids = {}
+        for doc_batch in chunks(documents, batch_size):
+            yield from self._embed_documents(doc_batch, first_chunk_ids)
+
+    def upsert_batches(self, embedded_documents: Iterable[Tuple[Dict[str, Any], List[float]]],
+                       batch_size: Optional[int] = None) -> int:
+        """Upsert embedded documents in parallel batches and return how many were upserted."""
+        batch_size = batch_size or self.config.UPSERT_BATCH_SIZE
+        
+        # Bound the number of in-flight requests so memory stays O(batch_size)
+        max_in_flight = self.config.PINECONE_POOL_THREADS
+        in_flight = deque()
+        upserted = 0
+        
+        def complete_oldest() -> int:
+            async_result, ids, embeddings, metadatas, contents = in_flight.popleft()
+            async_result.get()
+            self._add_to_local_index(ids, embeddings, metadatas, contents)
+            self._clear_response_caches()
+            return len(ids)
+        
+        for batch in chunks(embedded_documents, batch_size):
+            ids = [str(doc['chunk_id']) for doc, _ in batch]
+            # The local index keeps a float32 copy of the batch until the upsert completes
+            embeddings = np.asarray([embedding for _, embedding in batch], dtype=np.float32)
+            contents = [doc['content'] for doc, _ in batch]
+            hashes = [content_hash(content) for content in contents]
+            metadatas = [
+                {
                     'page_number': doc['page_number'],
+                    'chunk_offset': doc.get('chunk_offset', 0),
                     'has_images': doc.get('has_images', False),
-                    'content': doc['content'][:500]  # Store first 500 chars as metadata
+                    'hash': chunk_hash
                 }
-            }
-            vectors.append(vector)
+                for (doc, _), chunk_hash in zip(batch, hashes)
+            ]
+            for (doc, _), metadata in zip(batch, metadatas):
+                if 'duplicate_of' in doc:
+                    metadata['duplicate_of'] = str(doc['duplicate_of'])
             
-            # Upsert in batches
-            if len(vectors) >= batch_size:
-                self.index.upsert(vectors=vectors)
-                vectors = []
+            # Store contents before the vectors referencing them become searchable
+            self.content_store.put_many(zip(hashes, contents))
+            
+            # Vector dicts are only assembled for the request itself
+            vectors = [
+                {'id': vector_id, 'values': values, 'metadata': metadata}
+                for vector_id, (_, values), metadata in zip(ids, batch, metadatas)
+            ]
+            
+            if len(in_flight) >= max_in_flight:
+                upserted += complete_oldest()
+            in_flight.append((self.index.upsert(vectors=vectors, async_req=True), ids, embeddings, metadatas, contents))
         
-        # Upsert any remaining vectors
-        if vectors:
-            self.index.upsert(vectors=vectors)
+        # Wait for the remaining requests to complete
+        while in_flight:
+            upserted += complete_oldest()
+        
+        return upserted
+
+    def upsert_documents(self, documents: Iterable[Dict[str, Any]], batch_size: Optional[int] = None,
+                         embed_batch_size: Optional[int] = None) -> int:
+        """Embed and upsert documents to the vector store, streaming them in batches."""
+        total = len(documents) if hasattr(documents, '__len__') else None
+        progress_documents = tqdm(documents, total=total, desc="Processing documents")
+        return self.upsert_batches(
+            self.iter_embeddings(progress_documents, batch_size=embed_batch_size),
+            batch_size=batch_size
+        )
+
+    def _add_to_local_index(self, ids: List[str], embeddings: np.ndarray,
+                            metadatas: List[Dict[str, Any]], contents: List[str]) -> None:
+        """Mirror upserted vectors into the local index, overwriting the oldest when full."""
+        if not ids:
+            return
+        
+        limit = self.config.LOCAL_INDEX_SIZE
+        if self._local_vectors is None:
+            self._local_vectors = np.zeros((limit, self.config.GEMINI_EMBEDDING_DIM), dtype=np.float32)
+        
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        normalized = embeddings / np.where(norms > 0, norms, 1)
+        
+        for vector_id, values, metadata, content in zip(ids, normalized, metadatas, contents):
+            # Upserting an existing id replaces it, as in Pinecone
+            slot = self._local_slots.get(vector_id)
+            if slot is None:
+                slot = self._local_next
+                self._local_next = (self._local_next + 1) % limit
+                self._local_count = min(self._local_count + 1, limit)
+                evicted = self._local_entries[slot]
+                if evicted is not None:
+                    del self._local_slots[evicted['id']]
+                self._local_slots[vector_id] = slot
+            
+            self._local_vectors[slot] = values
+            self._local_entries[slot] = {'id': vector_id, 'metadata': metadata, 'content': content}
+
+    def _clear_response_caches(self) -> None:
+        """Forget cached answers, which may no longer match the indexed content."""
+        for cache in self.response_caches.values():
+            cache.clear()
+
+    def _clear_local_index(self) -> None:
+        """Empty the local index."""
+        self._local_vectors = None
+        self._local_entries: List[Optional[Dict[str, Any]]] = [None] * self.config.LOCAL_INDEX_SIZE
+        self._local_slots: Dict[str, int] = {}
+        self._local_next = 0
+        self._local_count = 0
+
+    def _search_local(self, query_embedding: List[float], top_k: int) -> Optional[List[Dict]]:
+        """Search the local index, returning None when Pinecone should be queried instead."""
+        # A small working set says little about the rest of the corpus, so
+        # Pinecone stays authoritative until enough vectors are held locally
+        if self._local_count < max(top_k, self.config.LOCAL_INDEX_MIN_SIZE):
+            return None
+        
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm == 0:
+            return None
+        
+        # Slots fill from the start, so the first _local_count rows are populated
+        scores = self._local_vectors[:self._local_count] @ (query_vector / norm)
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        if scores[top[0]] < self.config.LOCAL_INDEX_THRESHOLD:
+            return None
+        
+        return [
+            {
+                'id': self._local_entries[i]['id'],
+                'score': float(scores[i]),
+                'metadata': self._local_entries[i]['metadata'],
+                'content': self._local_entries[i]['content']
+            }
+            for i in top
+        ]
 
     def search(self, query: str, top_k: int = 5, filter_conditions: Optional[Dict] = None) -> List[Dict]:
         """Search for similar documents."""
-        # Get query embedding
-        query_embedding = self.get_embedding(query)
-        
         try:
+            # Get query embedding
+            query_embedding = self.get_embedding(query)
+            
+            # Serve from the local index when it holds a close enough match
+            if not filter_conditions:
+                local_results = self._search_local(query_embedding, top_k)
+                if local_results is not None:
+                    return local_results
+            
             # Search in Pinecone
             results = self.index.query(
                 vector=query_embedding,
@@ -146,14 +399,23 @@ class VectorStore:
                 include_metadata=True
             )
             
+            # Fetch the full contents of all matches at once
+            contents = self.content_store.get_many(
+                [match.metadata['hash'] for match in results.matches if match.metadata and 'hash' in match.metadata]
+            )
+            
             # Format results
             formatted_results = []
             for match in results.matches:
+                metadata = match.metadata or {}
+                if 'hash' in metadata and metadata['hash'] not in contents:
+                    print(f"Warning: Content for match {match.id} not found in {self.config.CONTENT_STORE_PATH}")
                 formatted_results.append({
                     'id': match.id,
                     'score': match.score,
-                    'metadata': match.metadata or {},
-                    'content': (match.metadata or {}).get('content', '')
+                    'metadata': metadata,
+                    # Vectors written before contents moved out of metadata still carry a prefix
+                    'content': contents.get(metadata.get('hash'), metadata.get('content', ''))
                 })
                 
             return formatted_results
@@ -172,8 +434,17 @@ class VectorStore:
             if total_vectors > 0:
                 # If there are vectors, delete them
                 self.index.delete(delete_all=True)
+                self._clear_local_index()
+                self._clear_response_caches()
+                self.content_store.clear()
                 print(f"Deleted all vectors from index '{self.config.INDEX_NAME}'")
             else:
                 print("No vectors to delete")
         except Exception as e:
             print(f"Error deleting vectors: {str(e)}")
+
+
+@functools.lru_cache(maxsize=1)
+def get_vector_store() -> VectorStore:
+    """Return the shared VectorStore, creating it on first use."""
+    return VectorStore()